@@ -0,0 +1,91 @@
+# benchmark.py: Comparação das heurísticas e das ramificações do Numbrix nos
+# testes públicos.
+# Uso: $ python3 benchmark.py [<test_dir>] [<max_expanded>]
+
+import os
+import sys
+import time
+
+from numbrix import Board, Numbrix
+from search import InstrumentedProblem, astar_search, breadth_first_tree_search, \
+    depth_first_inplace_search, depth_first_tree_search, greedy_search
+from utils import print_table
+
+
+class LimitExceeded(Exception):
+    """ Lançada quando uma procura excede o número máximo de expansões. """
+
+
+class LimitedProblem(InstrumentedProblem):
+    """ Problema instrumentado que interrompe a procura ao fim de
+    'maxExpanded' expansões (chamadas a actions). """
+
+    def __init__(self, problem, maxExpanded):
+        super().__init__(problem)
+        self.maxExpanded = maxExpanded
+
+    def actions(self, state):
+        if self.succs >= self.maxExpanded:
+            raise LimitExceeded()
+        return super().actions(state)
+
+
+def test_instances(directory: str) -> list:
+    """ Devolve os caminhos dos ficheiros de input do diretório, por ordem
+    do número do teste. """
+    names = [name for name in os.listdir(directory) if name.startswith("input") and name.endswith(".txt")]
+    return [os.path.join(directory, name) for name in sorted(names, key = lambda name : int(name[5:-4]))]
+
+
+def run(searcher, filename: str, maxExpanded: int, **options) -> tuple:
+    """ Resolve a instância com a procura dada e devolve o triplo (resolvido,
+    nós expandidos, segundos). As opções são passadas ao Numbrix. """
+    problem = LimitedProblem(Numbrix(Board.parse_instance(filename), **options), maxExpanded)
+    start = time.perf_counter()
+    try:
+        node = searcher(problem)
+        solved = node is not None and problem.goal_test(node.state)
+    except LimitExceeded:
+        solved = False
+    return (solved, problem.succs, time.perf_counter() - start)
+
+
+def compare(instances: list, searchers: list, option: str, values, maxExpanded: int):
+    """ Imprime uma tabela com, para cada procura e cada valor da opção do
+    Numbrix, os nós expandidos e o tempo de cada instância, e os totais.
+    Uma instância não resolvida dentro do limite aparece com '*'. """
+    header = ["Searcher", option] + [os.path.basename(path)[5:-4] for path in instances] + ["total", "seconds"]
+    table = []
+    for searcher in searchers:
+        for value in values:
+            row = [searcher.__name__, value]
+            expanded = seconds = 0
+            for path in instances:
+                solved, nodes, elapsed = run(searcher, path, maxExpanded, **{option: value})
+                row.append(str(nodes) + ("" if solved else "*"))
+                expanded += nodes
+                seconds += elapsed
+            table.append(row + [expanded, "{:.2f}".format(seconds)])
+    print_table(table, header)
+
+
+def compare_heuristics(instances: list, heuristics=None, searchers=(astar_search, greedy_search),
+                       maxExpanded: int = 20000):
+    """ Compara as heurísticas de Numbrix.heuristics com astar_search e
+    greedy_search. """
+    compare(instances, searchers, "heuristic", heuristics or list(Numbrix.heuristics), maxExpanded)
+
+
+def compare_branchings(instances: list, branchings=None,
+                       searchers=(depth_first_tree_search, depth_first_inplace_search, breadth_first_tree_search),
+                       maxExpanded: int = 20000):
+    """ Compara as ramificações de Numbrix.branchings com as procuras em
+    árvore. """
+    compare(instances, searchers, "branching", branchings or list(Numbrix.branchings), maxExpanded)
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "tests_final_public"
+    maxExpanded = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    compare_heuristics(test_instances(directory), maxExpanded = maxExpanded)
+    compare_branchings(test_instances(directory), maxExpanded = maxExpanded)
@@ -0,0 +1,85 @@
+# consistency.py: Verificação das estruturas incrementais do Numbrix.
+# Compara, ao longo de colocações aleatórias das soluções dos testes
+# públicos, as estruturas mantidas por NumbrixState.place (CandidateActions,
+# Regions, Domains e Distances) com as mesmas estruturas calculadas de raiz.
+# Uso: $ python3 consistency.py [<test_dir>] [<play_outs>] [<seed>]
+
+import os
+import random
+import sys
+
+from benchmark import test_instances
+from numbrix import Board, CandidateActions, Distances, Domains, Numbrix, NumbrixState, Regions
+
+
+def solution_actions(inputFile: str, outputFile: str) -> list:
+    """ Devolve as ações (linha, coluna, número) que completam o tabuleiro
+    do input com a solução do output. """
+    board = Board.parse_instance(inputFile)
+    with open(outputFile) as f:
+        rows = [line.split() for line in f if line.strip()]
+    return [(row, col, int(rows[row][col])) for row in range(board.size) for col in range(board.size)
+            if board.get_number(row, col) == 0]
+
+
+def compare(state: NumbrixState) -> list:
+    """ Devolve a lista das estruturas do estado que diferem das
+    calculadas de raiz a partir do seu tabuleiro. """
+    board = state.get_board()
+    errors = []
+    candidates = CandidateActions.from_board(board)
+    if state.candidates.dead != candidates.dead or \
+        {n: set(cells) for n, cells in state.candidates.byNumber.items()} != \
+        {n: set(cells) for n, cells in candidates.byNumber.items()} or \
+        {i: set(numbers) for i, numbers in state.candidates.byCell.items()} != \
+        {i: set(numbers) for i, numbers in candidates.byCell.items()}:
+        errors.append("candidates")
+    regions = Regions.from_board(board)
+    if state.regions.dead != regions.dead or set(state.regions.regions) != set(regions.regions):
+        errors.append("regions")
+    domains = Domains.from_board(board)
+    if state.domains.dead != domains.dead or state.domains.domains != domains.domains or \
+        state.domains.counts != domains.counts:
+        errors.append("domains")
+    distances = Distances()
+    if any(distanceMap != distances.map_from(board, number)
+           for number, distanceMap in state.distances.maps.items()):
+        errors.append("distances")
+    return errors
+
+
+def play_out(inputFile: str, outputFile: str, rng: random.Random) -> int:
+    """ Coloca as ações da solução por uma ordem aleatória, comparando as
+    estruturas depois de cada colocação, e devolve o número de
+    diferenças encontradas. """
+    actions = solution_actions(inputFile, outputFile)
+    rng.shuffle(actions)
+    problem = Numbrix(Board.parse_instance(inputFile), propagation = False)
+    state = problem.initial
+    problem.prepare(state)
+    failures = 0
+    for action in actions:
+        # Calcula os mapas de distâncias antes da colocação, para que
+        # Distances.placed tenha mapas a manter ou a descartar.
+        for number in state.get_board().get_all_numbers():
+            state.distances.map_from(state.get_board(), number)
+        state.place(action[0], action[1], action[2])
+        errors = compare(state)
+        if errors:
+            failures += 1
+            print("{}: {} differ after {}".format(os.path.basename(inputFile), ", ".join(errors), action))
+    return failures
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "tests_final_public"
+    playOuts = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rng = random.Random(int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    failures = 0
+    for inputFile in test_instances(directory):
+        outputFile = os.path.join(directory, "output" + os.path.basename(inputFile)[5:])
+        if os.path.exists(outputFile):
+            for _ in range(playOuts):
+                failures += play_out(inputFile, outputFile, rng)
+    print("OK" if failures == 0 else "{} inconsistent states".format(failures))
+    sys.exit(1 if failures else 0)
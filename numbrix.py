@@ -7,18 +7,183 @@
 # 95531 Ana Rita Duarte
 
 import sys
-import copy
-from turtle import end_fill
+import random
+from array import array
+from itertools import chain
 
-from sympy import true
-from search import Problem, Node, astar_search, breadth_first_tree_search, depth_first_tree_search, greedy_search, recursive_best_first_search
+import numpy as np
+
+from search import Problem, Node, astar_search, breadth_first_tree_search, depth_first_tree_search, \
+    depth_first_inplace_search, greedy_search, recursive_best_first_search
+
+
+def bits(mask: int):
+    """ Itera os índices dos bits a 1 de um inteiro, do menos para o mais
+    significativo. """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask: int) -> int:
+    """ Devolve o número de bits a 1 de um inteiro (int.bit_count só existe
+    a partir do Python 3.10). """
+    return bin(mask).count("1")
+
+
+class PersistentArray:
+    """ Array de inteiros partido em blocos de tamanho fixo. Uma cópia
+    partilha todos os blocos com o original e um bloco só é copiado quando
+    é alterado pela primeira vez (copy-on-write). """
+    __slots__ = ("chunks", "chunkSize", "owned")
+
+    def __init__(self, typecode: str, length: int, chunkSize: int, fill: int = 0):
+        self.chunkSize = chunkSize
+        self.chunks = [array(typecode, [fill]) * min(chunkSize, length - start)
+                       for start in range(0, length, chunkSize)]
+        # Bitset dos blocos que pertencem só a esta cópia.
+        self.owned = (1 << len(self.chunks)) - 1
+
+    def __getitem__(self, index: int) -> int:
+        return self.chunks[index // self.chunkSize][index % self.chunkSize]
+
+    def __setitem__(self, index: int, value: int):
+        chunk = index // self.chunkSize
+        if not (self.owned >> chunk) & 1:
+            self.chunks[chunk] = self.chunks[chunk][:]
+            self.owned |= 1 << chunk
+        self.chunks[chunk][index % self.chunkSize] = value
+
+    def __len__(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+    def tolist(self) -> list:
+        """ Devolve os elementos numa lista, para percorrer o array todo sem
+        calcular o bloco de cada índice. """
+        return list(chain.from_iterable(self.chunks))
+
+    def decrement(self, mask: int) -> bool:
+        """ Subtrai 1 aos elementos cujos índices são os bits a 1 de 'mask'
+        e devolve False se algum deles ficar a 0. """
+        chunks = self.chunks
+        chunkSize = self.chunkSize
+        positive = True
+        while mask:
+            low = mask & -mask
+            mask ^= low
+            chunk, offset = divmod(low.bit_length() - 1, chunkSize)
+            if not (self.owned >> chunk) & 1:
+                chunks[chunk] = chunks[chunk][:]
+                self.owned |= 1 << chunk
+            value = chunks[chunk][offset] - 1
+            chunks[chunk][offset] = value
+            positive = positive and value > 0
+        return positive
+
+    def __eq__(self, obj):
+        # A comparação de listas compara primeiro por identidade, pelo que
+        # os blocos partilhados não chegam a ser percorridos.
+        return isinstance(obj, PersistentArray) and self.chunks == obj.chunks
+
+    def copy(self):
+        """ Devolve uma cópia que partilha todos os blocos com este array.
+        Os blocos deixam de ser exclusivos de ambos, pelo que a próxima
+        escrita em qualquer um dos dois copia apenas o bloco alterado. """
+        other = type(self).__new__(type(self))
+        other.chunkSize = self.chunkSize
+        other.chunks = list(self.chunks)
+        other.owned = self.owned = 0
+        return other
+
+
+class PersistentList(PersistentArray):
+    """ PersistentArray com os blocos em listas, para valores que não cabem
+    num array, como os bitsets de tamanho arbitrário. """
+    __slots__ = ()
+
+    def __init__(self, length: int, chunkSize: int, fill = None):
+        self.chunkSize = chunkSize
+        self.chunks = [[fill] * min(chunkSize, length - start) for start in range(0, length, chunkSize)]
+        self.owned = (1 << len(self.chunks)) - 1
+
+
+class PersistentMap(PersistentList):
+    """ Dicionário de chaves inteiras de 0 a length - 1 guardado num
+    PersistentList, em que None marca uma chave ausente, com o bitset das
+    chaves presentes ('keys'). Uma cópia partilha os blocos com o original,
+    pelo que uma alteração só copia o bloco da chave alterada. As chaves
+    são percorridas por ordem crescente. """
+    __slots__ = ("keys",)
+
+    def __init__(self, length: int, chunkSize: int):
+        super().__init__(length, chunkSize)
+        self.keys = 0
+
+    def get(self, key: int, default = None):
+        value = PersistentArray.__getitem__(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key: int):
+        value = PersistentArray.__getitem__(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: int, value):
+        PersistentArray.__setitem__(self, key, value)
+        self.keys |= 1 << key
+
+    def __delitem__(self, key: int):
+        if not self.keys >> key & 1:
+            raise KeyError(key)
+        PersistentArray.__setitem__(self, key, None)
+        self.keys &= ~(1 << key)
+
+    def pop(self, key: int, default = None):
+        value = self.get(key)
+        if value is None:
+            return default
+        del self[key]
+        return value
+
+    def __contains__(self, key: int) -> bool:
+        return self.keys >> key & 1 == 1
+
+    def __iter__(self):
+        return bits(self.keys)
+
+    def __len__(self) -> int:
+        return popcount(self.keys)
+
+    def __bool__(self) -> bool:
+        return self.keys != 0
+
+    def items(self):
+        chunks = self.chunks
+        chunkSize = self.chunkSize
+        for key in bits(self.keys):
+            yield key, chunks[key // chunkSize][key % chunkSize]
+
+    def copy(self):
+        other = super().copy()
+        other.keys = self.keys
+        return other
 
 
 class NumbrixState:
     state_id = 0
 
-    def __init__(self, board):
+    def __init__(self, board, candidates=None, regions=None, domains=None, distances=None):
         self.board = board
+        # Ações candidatas (CandidateActions), regiões vazias (Regions),
+        # domínios dos números (Domains) e mapas de distâncias (Distances),
+        # calculados na primeira chamada a Numbrix.actions e depois
+        # mantidos por place.
+        self.candidates = candidates
+        self.regions = regions
+        self.domains = domains
+        self.distances = distances
         self.id = NumbrixState.state_id
         NumbrixState.state_id += 1
 
@@ -28,57 +193,193 @@ class NumbrixState:
     def get_board(self) -> list:
         return self.board
 
+    def copy(self):
+        return NumbrixState(self.board.copy(), self.candidates, self.regions, self.domains, self.distances)
+
+    def place(self, row: int, col: int, number: int):
+        """ Coloca o número no tabuleiro e atualiza as ações candidatas. """
+        self.board.set_number(row, col, number)
+        index = row * self.board.size + col
+        if self.candidates is not None:
+            self.candidates = self.candidates.placed(self.board, index, number)
+        if self.regions is not None:
+            self.regions = self.regions.placed(self.board, index)
+        if self.domains is not None:
+            self.domains = self.domains.placed(self.board, index, number)
+        if self.distances is not None:
+            self.distances = self.distances.placed(index)
+
     def __eq__(self, obj):
         return isinstance(obj, NumbrixState) and self.board == obj.get_board()
     
     def __hash__(self):
-        return hash(str(self.board.repr))
+        return self.board.zobrist
 
 
 class Board:
-    """ Representação interna de um tabuleiro de Numbrix. """
+    """ Representação interna de um tabuleiro de Numbrix. As posições são
+    indexadas por linha * size + coluna num PersistentArray com um bloco
+    por linha, partilhado com o tabuleiro de origem até ser alterado.
+    Mantém também o índice número -> posição ('positions', -1 se o número
+    não está colocado, com sentinelas em 0 e size ** 2 + 1) e o conjunto de
+    números colocados como bitset ('placed', bit k a 1 se k está colocado),
+    bem como o bitset das posições ocupadas ('occupied', bit i a 1 se a
+    posição com o índice i tem um número).
+    O hash de Zobrist ('zobrist') é atualizado incrementalmente por
+    set_number. Como números consecutivos ficam sempre em posições de cores
+    opostas de um xadrez, 'parity' guarda a cor (0 ou 1) das posições dos
+    números ímpares, ou -1 enquanto o tabuleiro estiver vazio.
+    'links' conta os pares de números consecutivos colocados em posições
+    adjacentes e 'free' as posições vazias, ambos atualizados em O(1) por
+    set_number e clear_number: o tabuleiro está resolvido quando não há
+    posições vazias e há size ** 2 - 1 ligações. """
+    __slots__ = ("size", "cells", "positions", "placed", "occupied", "zobrist", "parity",
+                 "links", "free")
+
+    # Tabelas de adjacência, de Zobrist e de cores, calculadas uma vez por
+    # dimensão do tabuleiro.
+    _neighbour_tables = {}
+    _zobrist_keys = {}
+    _colour_tables = {}
+    _bit_masks = {}
+    _colour_masks = {}
+    _neighbour_masks = {}
+
     def __init__(self, n : int):
         self.size = n
-        self.repr = [([0] * n) for _ in range(n)]
-        self.numbers = []
-    
+        self.cells = PersistentArray('H', n * n, n)
+        self.positions = PersistentArray('i', n * n + 2, n, -1)
+        self.placed = 0
+        self.occupied = 0
+        self.zobrist = 0
+        self.parity = -1
+        self.links = 0
+        self.free = n * n
+
+    @staticmethod
+    def neighbour_table(n: int) -> tuple:
+        """ Devolve, para cada índice do buffer, os índices das posições
+        adjacentes pela ordem abaixo, acima, esquerda, direita. """
+        table = Board._neighbour_tables.get(n)
+        if table is None:
+            table = []
+            for row in range(n):
+                for col in range(n):
+                    index = row * n + col
+                    adjacent = []
+                    if row < n - 1:
+                        adjacent.append(index + n)
+                    if row > 0:
+                        adjacent.append(index - n)
+                    if col > 0:
+                        adjacent.append(index - 1)
+                    if col < n - 1:
+                        adjacent.append(index + 1)
+                    table.append(tuple(adjacent))
+            table = Board._neighbour_tables[n] = tuple(table)
+        return table
+
+    @staticmethod
+    def zobrist_key(n: int, index: int, number: int) -> int:
+        """ Devolve a chave aleatória de 64 bits do par (posição, número).
+        As chaves só são geradas quando são pedidas pela primeira vez, pois
+        uma tabela com todos os pares ocuparia O(n ** 4). O gerador de cada
+        dimensão tem semente fixa, para que o hash seja reprodutível entre
+        execuções que coloquem os números pela mesma ordem. """
+        generator = Board._zobrist_keys.get(n)
+        if generator is None:
+            generator = Board._zobrist_keys[n] = ({}, random.Random(n))
+        keys, rng = generator
+        pair = index * (n * n + 1) + number
+        key = keys.get(pair)
+        if key is None:
+            key = keys[pair] = rng.getrandbits(64)
+        return key
+
+    @staticmethod
+    def colour_table(n: int) -> bytes:
+        """ Devolve, para cada índice do buffer, a cor (linha + coluna) % 2
+        da posição no xadrez do tabuleiro. """
+        table = Board._colour_tables.get(n)
+        if table is None:
+            table = bytes((row + col) % 2 for row in range(n) for col in range(n))
+            Board._colour_tables[n] = table
+        return table
+
+    @staticmethod
+    def bit_masks(n: int) -> tuple:
+        """ Devolve os bitsets, indexados como o buffer, de todas as
+        posições, das posições fora da primeira coluna e das posições fora
+        da última coluna. """
+        masks = Board._bit_masks.get(n)
+        if masks is None:
+            full = (1 << (n * n)) - 1
+            firstCol = sum(1 << (row * n) for row in range(n))
+            masks = Board._bit_masks[n] = (full, full & ~firstCol, full & ~(firstCol << (n - 1)))
+        return masks
+
+    @staticmethod
+    def colour_masks(n: int) -> tuple:
+        """ Devolve os bitsets das posições de cor 0 e de cor 1. """
+        masks = Board._colour_masks.get(n)
+        if masks is None:
+            colours = Board.colour_table(n)
+            black = sum(1 << index for index in range(n * n) if colours[index])
+            masks = Board._colour_masks[n] = (Board.bit_masks(n)[0] & ~black, black)
+        return masks
+
+    @staticmethod
+    def neighbour_masks(n: int) -> tuple:
+        """ Devolve, para cada índice do buffer, o bitset das posições
+        adjacentes. """
+        masks = Board._neighbour_masks.get(n)
+        if masks is None:
+            masks = Board._neighbour_masks[n] = tuple(sum(1 << i for i in adjacent)
+                                                      for adjacent in Board.neighbour_table(n))
+        return masks
+
+    def expand(self, mask: int) -> int:
+        """ Devolve o bitset das posições adjacentes a alguma posição do
+        bitset 'mask'. """
+        full, notFirstCol, notLastCol = Board.bit_masks(self.size)
+        return (((mask << 1) & notFirstCol) | ((mask >> 1) & notLastCol) |
+                (mask << self.size) | (mask >> self.size)) & full
+
+    def colour_of(self, number: int) -> int:
+        """ Devolve a cor das posições onde 'number' pode ficar, ou -1 se
+        o tabuleiro ainda não tem números. """
+        return self.parity ^ (1 - number % 2) if self.parity >= 0 else -1
+
+    def index(self, row: int, col: int) -> int:
+        """ Devolve o índice no buffer da respetiva posição do tabuleiro. """
+        if not (0 <= row < self.size and 0 <= col < self.size):
+            sys.exit("Position ({}, {}) out of board.".format(row, col))
+        return row * self.size + col
+
     def get_number(self, row: int, col: int) -> int:
         """ Devolve o valor na respetiva posição do tabuleiro. """
-        try:
-            return self.repr[row][col]
-        except IndexError as exception:
-            sys.exit(exception)
+        return self.cells[self.index(row, col)]
 
     def adjacent_vertical_numbers(self, row: int, col: int) -> (int, int):
         """ Devolve os valores imediatamente abaixo e acima, 
         respectivamente. """
-        try:
-            if row == 0:
-                return (self.repr[row + 1][col], None)
-            elif row == self.size - 1:
-                return (None, self.repr[row - 1][col])
-            else:
-                return (self.repr[row + 1][col], self.repr[row - 1][col])
-        except IndexError as exception:
-            sys.exit(exception)
+        index = self.index(row, col)
+        below = self.cells[index + self.size] if row < self.size - 1 else None
+        above = self.cells[index - self.size] if row > 0 else None
+        return (below, above)
     
     def adjacent_horizontal_numbers(self, row: int, col: int) -> (int, int):
         """ Devolve os valores imediatamente à esquerda e à direita, 
         respectivamente. """
-        try:
-            if col == 0:
-                return (None, self.repr[row][col + 1])
-            elif col == self.size - 1:
-                return (self.repr[row][col - 1], None)
-            else:
-                return (self.repr[row][col - 1], self.repr[row][col + 1])
-        except IndexError as exception:
-            sys.exit(exception)
+        index = self.index(row, col)
+        left = self.cells[index - 1] if col > 0 else None
+        right = self.cells[index + 1] if col < self.size - 1 else None
+        return (left, right)
     
-    @staticmethod    
-    def parse_instance(filename: str):
+    @classmethod
+    def parse_instance(cls, filename: str):
         """ Lê o ficheiro cujo caminho é passado como argumento e retorna
-        uma instância da classe Board. """
+        uma instância da classe Board (ou da subclasse usada). """
         try:
             file = open(filename, "r")
             lines = file.read().splitlines()
@@ -88,7 +389,7 @@ class Board:
 
         if len(lines[0].split()) != 1:
             sys.exit("File format not supported.")
-        board = Board(int(lines[0]))
+        board = cls(int(lines[0]))
 
         if len(lines) != board.size + 1:
             sys.exit("File format not supported.")
@@ -102,187 +403,1031 @@ class Board:
             for num in nums:
                 n = int(num)
                 if n != 0:
-                    board.repr[row][col] = n
-                    board.numbers.append(n)
+                    if n > board.size ** 2:
+                        sys.exit("Board not valid, contains numbers out of range.")
+                    if board.has_number(n):
+                        sys.exit("Board not valid, contains duplicate numbers.")
+                    board.set_number(row, col, n)
                 col += 1
             row += 1
 
-        if len(board.numbers) != len(set(board.numbers)):
-            sys.exit("Board not valid, contains duplicate numbers.")
+        return board
 
+    def copy(self):
+        """ Devolve um novo tabuleiro que partilha com este todas as linhas
+        e blocos do índice de posições que não venham a ser alterados. """
+        board = type(self).__new__(type(self))
+        board.size = self.size
+        board.cells = self.cells.copy()
+        board.positions = self.positions.copy()
+        board.placed = self.placed
+        board.occupied = self.occupied
+        board.zobrist = self.zobrist
+        board.parity = self.parity
+        board.links = self.links
+        board.free = self.free
         return board
 
     def get_size(self) -> int:
         return self.size
 
+    def distance(self, first: int, second: int) -> int:
+        """ Devolve a distância de Manhattan entre duas posições, dadas pelos
+        seus índices no buffer. """
+        return abs(first // self.size - second // self.size) + \
+            abs(first % self.size - second % self.size)
+
+    def gap_feasible(self, first: int, a: int, second: int, b: int) -> bool:
+        """ Verifica se os números a < b, nas posições com os índices dados,
+        podem ser ligados por um caminho de b - a passos: a distância de
+        Manhattan não pode ser maior que b - a e tem de ter a mesma
+        paridade. """
+        distance = self.distance(first, second)
+        return distance <= b - a and (b - a - distance) % 2 == 0
+
+    def placed_below(self, number: int) -> int:
+        """ Devolve o maior número colocado inferior a 'number', ou 0. """
+        return max((self.placed & ((1 << number) - 1)).bit_length() - 1, 0)
+
+    def placed_above(self, number: int) -> int:
+        """ Devolve o menor número colocado superior a 'number', ou 0. """
+        above = self.placed >> (number + 1)
+        return (above & -above).bit_length() + number if above else 0
+
     def get_all_numbers(self) -> list:
-        return self.numbers
+        return list(bits(self.placed))
+
+    def has_number(self, number: int) -> bool:
+        return (self.placed >> number) & 1 == 1
+
+    def get_position(self, number: int):
+        """ Devolve a posição (linha, coluna) do número, ou None se o número
+        ainda não foi colocado. """
+        index = self.positions[number]
+        return divmod(index, self.size) if index >= 0 else None
+
+    def count_links(self, index: int, number: int) -> int:
+        """ Devolve quantos dos números number - 1 e number + 1 estão em
+        posições adjacentes à posição com o índice dado. As sentinelas de
+        'positions' (-1) nunca são adjacentes. """
+        mask = Board.neighbour_masks(self.size)[index]
+        before = self.positions[number - 1]
+        after = self.positions[number + 1]
+        return (before >= 0 and mask >> before & 1) + (after >= 0 and mask >> after & 1)
 
     def set_number(self, row: int, col: int, number: int):
-        try:
-            self.repr[row][col] = number
-        except IndexError as exception:
-            sys.exit(exception)
-        self.numbers.append(number)
+        index = self.index(row, col)
+        self.clear_number(row, col)
+        self.cells[index] = number
+        self.positions[number] = index
+        self.placed |= 1 << number
+        self.occupied |= 1 << index
+        self.links += self.count_links(index, number)
+        self.free -= 1
+        # A cor de cada número fica fixa pelo primeiro número colocado, que
+        # ao ler o tabuleiro é o primeiro número do ficheiro.
+        if self.parity < 0:
+            self.parity = Board.colour_table(self.size)[index] ^ (1 - number % 2)
+        self.zobrist ^= Board.zobrist_key(self.size, index, number)
+
+    def clear_number(self, row: int, col: int):
+        """ Retira o número da respetiva posição, desfazendo set_number. """
+        index = self.index(row, col)
+        number = self.cells[index]
+        if number != 0:
+            self.cells[index] = 0
+            self.positions[number] = -1
+            self.placed &= ~(1 << number)
+            self.occupied &= ~(1 << index)
+            self.links -= self.count_links(index, number)
+            self.free += 1
+            self.zobrist ^= Board.zobrist_key(self.size, index, number)
+            # Sem números colocados, a cor dos números volta a estar livre.
+            if not self.placed:
+                self.parity = -1
+
+    def empty(self) -> int:
+        """ Devolve o bitset das posições vazias. """
+        return Board.bit_masks(self.size)[0] & ~self.occupied
+
+    def empty_neighbours(self, index: int) -> int:
+        """ Devolve o número de posições vazias adjacentes à posição com o
+        índice dado. """
+        cells = self.cells
+        return sum(cells[i] == 0 for i in Board.neighbour_table(self.size)[index])
+
+    def flood(self, start: int, allowed: int) -> tuple:
+        """ Devolve o par (posições, fronteira) de bitsets da região que
+        contém 'start' dentro das posições do bitset 'allowed', em que a
+        fronteira são as posições adjacentes à região fora dela. """
+        neighbours = Board.neighbour_table(self.size)
+        region = 1 << start
+        border = 0
+        stack = [start]
+        while stack:
+            for index in neighbours[stack.pop()]:
+                bit = 1 << index
+                if region & bit:
+                    continue
+                if allowed & bit:
+                    region |= bit
+                    stack.append(index)
+                else:
+                    border |= bit
+        return (region, border)
+
+    def is_solved(self) -> bool:
+        """ Verifica, pelos contadores, se todas as posições estão
+        preenchidas e cada número tem o seguinte numa posição adjacente. """
+        return self.free == 0 and self.links == self.size ** 2 - 1
+
+    def is_chain(self) -> bool:
+        """ Verifica se cada número colocado, exceto o último, tem o
+        seguinte numa posição adjacente. """
+        positions = self.positions
+        neighbours = Board.neighbour_table(self.size)
+        for number in range(1, self.size ** 2):
+            if positions[number + 1] not in neighbours[positions[number]]:
+                return False
+        return True
+
+    def cells_array(self) -> np.ndarray:
+        """ Devolve uma matriz NumPy size x size com os valores do
+        tabuleiro. """
+        return np.vstack([np.frombuffer(row, dtype=np.uint16) for row in self.cells.chunks])
+
+    def positions_array(self) -> np.ndarray:
+        """ Devolve um vetor NumPy com o índice da posição de cada número,
+        de 0 a size ** 2 + 1 (-1 para os números por colocar). """
+        return np.concatenate([np.frombuffer(chunk, dtype=np.intc) for chunk in self.positions.chunks])
 
     def to_string(self) -> str:
         string = ""
-        for i in range(self.size):
-            for j in range(self.size):
-                string += str(self.repr[i][j])
-                if j != self.size - 1:
-                    string += '\t'
-            string += '\n'
+        for row in self.cells.chunks:
+            string += "\t".join(str(number) for number in row) + "\n"
 
         return string
 
     def __eq__(self, obj):
-        if not isinstance(obj, Board) or self.size != obj.get_size() or set(self.numbers) != set(obj.get_all_numbers()):
+        # Tabuleiros diferentes têm quase sempre hashes diferentes, pelo que
+        # a comparação completa só é feita quando os hashes coincidem.
+        return isinstance(obj, Board) and self.zobrist == obj.zobrist and \
+            self.size == obj.get_size() and self.cells == obj.cells
+
+
+class BitBoard(Board):
+    """ Tabuleiro com o mesmo estado e resultados que Board, mas em que as
+    contagens de posições adjacentes vazias, as regiões e a verificação da
+    sequência são feitas com operações bit a bit sobre os bitsets das
+    posições ocupadas e das adjacências, em vez de percorrer as posições. """
+    __slots__ = ()
+
+    def empty_neighbours(self, index: int) -> int:
+        return popcount(Board.neighbour_masks(self.size)[index] & ~self.occupied)
+
+    def flood(self, start: int, allowed: int) -> tuple:
+        region = ring = 1 << start
+        while ring:
+            ring = self.expand(ring) & allowed & ~region
+            region |= ring
+        return (region, self.expand(region) & ~region)
+
+    def is_chain(self) -> bool:
+        positions = self.positions
+        masks = Board.neighbour_masks(self.size)
+        for number in range(1, self.size ** 2):
+            if not masks[positions[number]] >> positions[number + 1] & 1:
+                return False
+        return True
+
+
+class CandidateActions:
+    """ Ações candidatas de um estado, indexadas por número ('byNumber':
+    número -> tuplo de índices de posições) e por posição ('byCell':
+    índice -> tuplo de números), ambos em PersistentMap. Não são
+    alteradas: placed devolve uma nova instância cujos mapas partilham com
+    estes todos os blocos que a colocação não altera.
+    'dead' indica que o estado não tem solução: há dois números colocados
+    consecutivos impossíveis de ligar, ou um número que tem de ficar junto
+    a outro já colocado e não tem nenhuma posição possível. """
+    __slots__ = ("byNumber", "byCell", "dead")
+
+    def __init__(self, byNumber: PersistentMap, byCell: PersistentMap, dead: bool = False):
+        self.byNumber = byNumber
+        self.byCell = byCell
+        self.dead = dead
+
+    @staticmethod
+    def is_valid(board: Board, index: int, n: int) -> bool:
+        """ Verifica se o número n, ainda por colocar, pode ocupar a posição
+        vazia com o índice dado: tem de ser adjacente aos números n - 1 e
+        n + 1 que já estejam colocados (pelo menos um deles), e se algum
+        destes falta, exceto nos extremos 1 e total, a posição tem de ter
+        uma adjacente vazia para continuar a sequência. """
+        if Board.colour_table(board.size)[index] != board.colour_of(n):
+            return False
+        positions = board.positions
+        adjacent = Board.neighbour_table(board.size)[index]
+        lower = positions[n - 1]
+        upper = positions[n + 1]
+        if (lower < 0 and upper < 0) or (lower >= 0 and lower not in adjacent) or \
+            (upper >= 0 and upper not in adjacent):
+            return False
+        if ((lower < 0 and n > 1) or (upper < 0 and n < board.size ** 2)) and \
+            board.empty_neighbours(index) == 0:
             return False
 
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.repr[i][j] != obj.get_number(i, j):
-                    return False
+        # A posição tem de poder ser ligada aos números colocados mais
+        # próximos, abaixo e acima de n.
+        below = board.placed_below(n)
+        if below and not board.gap_feasible(positions[below], below, index, n):
+            return False
+        above = board.placed_above(n)
+        return not above or board.gap_feasible(index, n, positions[above], above)
+
+    @staticmethod
+    def cells_for(board: Board, n: int) -> tuple:
+        """ Devolve os índices das posições onde n pode ser colocado, a
+        partir das posições vazias adjacentes a n - 1 e a n + 1. """
+        candidates = []
+        cells = board.cells
+        positions = board.positions
+        neighbours = Board.neighbour_table(board.size)
+        if n < 1 or n > board.size ** 2 or positions[n] >= 0:
+            return ()
+        for source in (positions[n - 1], positions[n + 1]):
+            if source < 0:
+                continue
+            for index in neighbours[source]:
+                if cells[index] == 0 and index not in candidates and \
+                    CandidateActions.is_valid(board, index, n):
+                    candidates.append(index)
+        return tuple(candidates)
+
+    @staticmethod
+    def from_board(board: Board):
+        """ Calcula todas as ações candidatas de raiz. Só os números que
+        faltam junto a números colocados podem ter candidatos. """
+        placed = board.placed
+        positions = board.positions
+        total = board.size ** 2
+        missing = ((placed << 1) | (placed >> 1)) & ~placed & ((1 << (total + 1)) - 2)
+        byNumber = PersistentMap(total + 2, board.size)
+        byCell = PersistentMap(total, board.size)
+        dead = False
+        for n in bits(missing):
+            candidates = CandidateActions.cells_for(board, n)
+            if candidates:
+                byNumber[n] = candidates
+                for index in candidates:
+                    byCell[index] = byCell.get(index, ()) + (n,)
+            else:
+                dead = True
 
+        previous = 0
+        colours = Board.colour_table(board.size)
+        for number in bits(placed):
+            if colours[positions[number]] != board.colour_of(number):
+                dead = True
+            if previous and not board.gap_feasible(positions[previous], previous, positions[number], number):
+                dead = True
+            previous = number
+
+        return CandidateActions(byNumber, byCell, dead)
+
+    def placed(self, board: Board, index: int, number: int):
+        """ Devolve as ações candidatas depois de 'number' ter sido colocado
+        na posição 'index' de 'board'. Só mudam os candidatos de number e
+        dos números number - 1 e number + 1, os da própria posição, os das
+        posições adjacentes, que perdem uma adjacente vazia, e os dos números
+        nos extremos das duas lacunas em que number divide a sua. """
+        byNumber = self.byNumber.copy()
+        byCell = self.byCell.copy()
+        dead = self.dead
+
+        def remove(n, cell):
+            nonlocal dead
+            cells = tuple(i for i in byNumber[n] if i != cell)
+            if cells:
+                byNumber[n] = cells
+            else:
+                del byNumber[n]
+                dead = dead or n != number
+            numbers = tuple(m for m in byCell[cell] if m != n)
+            if numbers:
+                byCell[cell] = numbers
+            else:
+                del byCell[cell]
+
+        for cell in byNumber.get(number, ()):
+            remove(number, cell)
+        for n in byCell.get(index, ()):
+            remove(n, index)
+        for adjacentIndex in Board.neighbour_table(board.size)[index]:
+            for n in byCell.get(adjacentIndex, ()):
+                if not CandidateActions.is_valid(board, adjacentIndex, n):
+                    remove(n, adjacentIndex)
+        for n in {number - 1, number + 1, board.placed_below(number) + 1, board.placed_above(number) - 1}:
+            if n < 1 or n > board.size ** 2 or board.has_number(n):
+                continue
+            # Só as entradas que mudam são escritas, para não copiar blocos
+            # dos mapas sem necessidade.
+            previous = byNumber.get(n, ())
+            candidates = CandidateActions.cells_for(board, n)
+            if not candidates and (board.has_number(n - 1) or board.has_number(n + 1)):
+                dead = True
+            if candidates == previous:
+                continue
+            for cell in previous:
+                if cell not in candidates:
+                    numbers = tuple(m for m in byCell[cell] if m != n)
+                    if numbers:
+                        byCell[cell] = numbers
+                    else:
+                        del byCell[cell]
+            if candidates:
+                byNumber[n] = candidates
+                for cell in candidates:
+                    if cell not in previous:
+                        byCell[cell] = byCell.get(cell, ()) + (n,)
+            else:
+                del byNumber[n]
+
+        return CandidateActions(byNumber, byCell, dead)
+
+    def actions(self, boardSize: int) -> list:
+        """ Devolve a lista de ações (linha, coluna, número), com os números
+        com menos posições possíveis primeiro. Um estado sem solução não tem
+        ações. """
+        if self.dead:
+            return []
+        actionsList = [(index // boardSize, index % boardSize, n)
+                       for n, cells in self.byNumber.items() for index in cells]
+        return sorted(actionsList, key = lambda action : len(self.byNumber[action[2]]))
+
+
+class Regions:
+    """ Regiões (componentes ligadas) de posições vazias de um estado, cada
+    uma guardada como um par (posições, fronteira) de bitsets de índices,
+    em que a fronteira são as posições ocupadas adjacentes à região. Não
+    são alteradas: placed só volta a calcular a região da posição ocupada.
+    'dead' indica que as regiões não podem ser preenchidas pelas lacunas
+    da sequência, pelo que o estado não tem solução. """
+    __slots__ = ("regions", "dead")
+
+    def __init__(self, board: Board, regions: tuple):
+        self.regions = regions
+        self.dead = Regions.is_dead(board, regions)
+
+    @staticmethod
+    def from_board(board: Board):
+        """ Calcula todas as regiões de raiz. """
+        empty = board.empty()
+        regions = []
+        while empty:
+            region = board.flood((empty & -empty).bit_length() - 1, empty)
+            regions.append(region)
+            empty &= ~region[0]
+        return Regions(board, tuple(regions))
+
+    def placed(self, board: Board, index: int):
+        """ Devolve as regiões depois de a posição 'index' ter sido ocupada.
+        Só a região que a continha muda, podendo partir-se em até quatro. """
+        bit = 1 << index
+        regions = []
+        for region in self.regions:
+            if not region[0] & bit:
+                regions.append(region)
+                continue
+            allowed = region[0] & ~bit
+            for adjacentIndex in Board.neighbour_table(board.size)[index]:
+                if allowed & (1 << adjacentIndex):
+                    part = board.flood(adjacentIndex, allowed)
+                    regions.append(part)
+                    allowed &= ~part[0]
+        return Regions(board, tuple(regions))
+
+    @staticmethod
+    def is_dead(board: Board, regions: tuple) -> bool:
+        """ Cada lacuna da sequência (números a < b colocados, com os números
+        entre eles por colocar, incluindo antes do primeiro e depois do
+        último) tem de ficar inteira numa região que toque as posições de a
+        e de b. Um estado não tem solução se alguma lacuna não cabe em
+        nenhuma região, ou se alguma região não pode ser preenchida pelas
+        lacunas que lhe cabem, por falta de lacunas ou por lhe caberem à
+        força lacunas maiores do que ela. """
+        if not board.placed or not regions:
+            return False
+        positions = board.positions
+        total = board.size ** 2
+        sizes = [popcount(region[0]) for region in regions]
+        capacity = [0] * len(regions)
+        forced = [0] * len(regions)
+
+        previous = 0
+        for number in list(bits(board.placed)) + [total + 1]:
+            gap = number - previous - 1
+            if gap > 0:
+                fits = [i for i, region in enumerate(regions) if sizes[i] >= gap and \
+                    (previous == 0 or region[1] >> positions[previous] & 1) and \
+                    (number > total or region[1] >> positions[number] & 1)]
+                if not fits:
+                    return True
+                if len(fits) == 1:
+                    forced[fits[0]] += gap
+                for i in fits:
+                    capacity[i] += gap
+            previous = number
+
+        return any(capacity[i] < sizes[i] or forced[i] > sizes[i] for i in range(len(regions)))
+
+
+class Domains:
+    """ Domínio de cada número, como bitset dos índices das posições onde o
+    número pode ficar ('domains', indexado pelo número). Um número colocado
+    tem como domínio a sua posição. Os domínios são mantidos com
+    consistência de arcos: uma posição só fica no domínio de k se for
+    adjacente a alguma posição dos domínios de k - 1 e de k + 1.
+    'counts' guarda, para cada posição, quantos domínios a contêm, e
+    'holders' o bitset dos números cujo domínio a continha quando os
+    domínios foram calculados de raiz: como os domínios só diminuem, é um
+    superconjunto dos números cujo domínio ainda a contém, partilhado por
+    todos os estados descendentes. 'domains' e 'counts' são persistentes,
+    pelo que placed devolve uma nova instância que só copia os blocos
+    alterados. 'dead' indica que algum domínio ficou vazio ou que alguma
+    posição deixou de estar em algum domínio, pelo que o estado não tem
+    solução. """
+    __slots__ = ("domains", "counts", "holders", "dead")
+
+    def __init__(self, domains: PersistentList, counts: PersistentArray, holders: tuple, dead: bool):
+        self.domains = domains
+        self.counts = counts
+        self.holders = holders
+        self.dead = dead
+
+    @staticmethod
+    def restrict(domains: PersistentList, counts: PersistentArray, number: int, domain: int) -> bool:
+        """ Reduz o domínio de 'number' a 'domain' e devolve False se alguma
+        das posições que saem do domínio deixar de estar em algum domínio. """
+        removed = domains[number] & ~domain
+        domains[number] = domain
+        return counts.decrement(removed)
+
+    @staticmethod
+    def revise(board: Board, domains: PersistentList, counts: PersistentArray, queue: set) -> bool:
+        """ Aplica o AC-3 aos domínios, a partir dos números em 'queue', e
+        devolve False se algum domínio ficar vazio ou alguma posição deixar
+        de estar em algum domínio. """
+        total = board.size ** 2
+        # Os blocos são lidos diretamente; a lista de blocos é a mesma
+        # depois de restrict, que só substitui os blocos que copia.
+        chunks = domains.chunks
+        chunkSize = domains.chunkSize
+        while queue:
+            number = queue.pop()
+            if board.has_number(number):
+                continue
+            current = domain = chunks[number // chunkSize][number % chunkSize]
+            if number > 1:
+                domain &= board.expand(chunks[(number - 1) // chunkSize][(number - 1) % chunkSize])
+            if number < total:
+                domain &= board.expand(chunks[(number + 1) // chunkSize][(number + 1) % chunkSize])
+            if domain != current:
+                if not domain or not Domains.restrict(domains, counts, number, domain):
+                    return False
+                queue.update((number - 1, number + 1))
+                queue.discard(0)
+                queue.discard(total + 1)
         return True
 
+    @staticmethod
+    def from_board(board: Board):
+        """ Calcula todos os domínios de raiz: cada número por colocar começa
+        com todas as posições vazias da sua cor. """
+        total = board.size ** 2
+        positions = board.positions
+        empty = board.empty()
+        byColour = [mask & empty for mask in Board.colour_masks(board.size)]
+        domains = PersistentList(total + 2, board.size, 0)
+        counts = PersistentArray('I', total, board.size)
+        for number in range(1, total + 1):
+            if positions[number] >= 0:
+                domains[number] = 1 << positions[number]
+            elif board.parity >= 0:
+                domains[number] = byColour[board.colour_of(number)]
+            else:
+                domains[number] = byColour[0] | byColour[1]
+            for index in bits(domains[number]):
+                counts[index] += 1
+        missing = set(n for n in range(1, total + 1) if positions[n] < 0)
+        alive = all(counts[index] for index in range(total)) and \
+            Domains.revise(board, domains, counts, missing)
+        holders = [0] * total
+        for number in range(1, total + 1):
+            for index in bits(domains[number]):
+                holders[index] |= 1 << number
+        return Domains(domains, counts, tuple(holders), not alive)
+
+    def placed(self, board: Board, index: int, number: int):
+        """ Devolve os domínios depois de 'number' ter sido colocado na
+        posição 'index': o seu domínio passa a ser essa posição, que sai
+        dos domínios dos outros números que a continham, e o AC-3 parte
+        daí. """
+        bit = 1 << index
+        if self.dead or not self.domains[number] & bit:
+            return Domains(self.domains, self.counts, self.holders, True)
+        domains = self.domains.copy()
+        counts = self.counts.copy()
+        result = Domains(domains, counts, self.holders, True)
+        if not Domains.restrict(domains, counts, number, bit):
+            return result
+        queue = {number - 1, number + 1}
+        for n in bits(self.holders[index] & ~(1 << number)):
+            domain = domains[n]
+            if domain & bit:
+                if domain == bit:
+                    return result
+                Domains.restrict(domains, counts, n, domain & ~bit)
+                queue.update((n - 1, n, n + 1))
+        queue.discard(0)
+        queue.discard(board.size ** 2 + 1)
+        result.dead = not Domains.revise(board, domains, counts, queue)
+        return result
+
+    def forced_action(self, board: Board):
+        """ Devolve uma ação forçada pelos domínios, ou None: um número por
+        colocar com um único elemento no domínio, ou uma posição vazia que
+        está no domínio de um único número. """
+        boardSize = board.get_size()
+        total = boardSize ** 2
+        domains = self.domains.tolist()
+        once = twice = 0
+        for number in range(1, total + 1):
+            domain = domains[number]
+            if not board.has_number(number):
+                if domain & (domain - 1) == 0:
+                    index = domain.bit_length() - 1
+                    return (index // boardSize, index % boardSize, number)
+                twice |= once & domain
+                once |= domain
+        single = once & ~twice
+        if single:
+            index = (single & -single).bit_length() - 1
+            for number in range(1, total + 1):
+                if domains[number] >> index & 1 and not board.has_number(number):
+                    return (index // boardSize, index % boardSize, number)
+        return None
+
+
+class Distances:
+    """ Mapas de distâncias, por caminhos de posições vazias, a partir das
+    posições dos números colocados ('maps': número -> (alcance, anéis)),
+    em que o anel d é o bitset das posições vazias a distância d e o
+    alcance é a união dos anéis. Cada mapa é calculado por BFS só quando é
+    pedido e fica em cache no estado. placed devolve uma nova instância
+    que mantém os mapas cujo alcance não inclui a posição ocupada. São
+    usados pelas heurísticas (h_gap_slack), não por is_dead: os domínios
+    já garantem que as lacunas são alcançáveis. """
+    __slots__ = ("maps",)
+
+    def __init__(self, maps: dict = None):
+        self.maps = maps if maps is not None else {}
+
+    def placed(self, index: int):
+        """ Devolve os mapas depois de a posição 'index' ter sido ocupada. """
+        return Distances({number: distanceMap for number, distanceMap in self.maps.items()
+                          if not distanceMap[0] >> index & 1})
+
+    def map_from(self, board: Board, number: int) -> tuple:
+        """ Devolve o par (alcance, anéis) a partir da posição de 'number'. """
+        distanceMap = self.maps.get(number)
+        if distanceMap is None:
+            empty = board.empty()
+            ring = reach = 1 << board.positions[number]
+            rings = [ring]
+            while True:
+                ring = board.expand(ring) & empty & ~reach
+                if not ring:
+                    break
+                reach |= ring
+                rings.append(ring)
+            distanceMap = self.maps[number] = (reach, tuple(rings))
+        return distanceMap
+
+    def between(self, board: Board, a: int, b: int):
+        """ Devolve o comprimento do caminho mais curto da posição de 'a' à
+        posição de 'b' que só passa por posições vazias, ou None se não
+        existir. É um minorante de b - a quando a e b estão colocados. """
+        target = board.expand(1 << board.positions[b])
+        for distance, ring in enumerate(self.map_from(board, a)[1]):
+            if ring & target:
+                return distance + 1
+        return None
+
 
 class Numbrix(Problem):
-    def __init__(self, board: Board):
-        """ O construtor especifica o estado inicial. """
-        super().__init__(NumbrixState(board))
+    # Dimensão a partir da qual h (e goal_test em modo debug) usa as versões
+    # NumPy.
+    vectorized_size = 16
+
+    def __init__(self, board: Board, debug: bool = False, propagation: bool = True,
+                 vectorized: bool = None, heuristic: str = "empty_lines", branching: str = "all"):
+        """ O construtor especifica o estado inicial. Em modo debug, as
+        ações aplicadas pelas procuras também são validadas. Com
+        propagation, as colocações forçadas são aplicadas ao estado inicial
+        (sobre uma cópia do tabuleiro) e a cada estado resultante. Com
+        vectorized, h (e a verificação de goal_test em modo debug) usa NumPy
+        sobre o tabuleiro inteiro; por omissão, só a partir de
+        vectorized_size. 'heuristic' é o nome da
+        heurística usada por h, de entre as de Numbrix.heuristics, e
+        'branching' o nome da ramificação usada por actions, de entre as de
+        Numbrix.branchings. """
+        if heuristic not in Numbrix.heuristics:
+            raise ValueError("Unknown heuristic '{}', expected one of {}.".format(
+                heuristic, ", ".join(Numbrix.heuristics)))
+        if branching not in Numbrix.branchings:
+            raise ValueError("Unknown branching '{}', expected one of {}.".format(
+                branching, ", ".join(Numbrix.branchings)))
+        super().__init__(NumbrixState(board.copy() if propagation else board))
+        self.debug = debug
+        self.propagation = propagation
+        self.vectorized = board.size >= Numbrix.vectorized_size if vectorized is None else vectorized
+        self.heuristic = heuristic
+        self.heuristicFunction = getattr(self, Numbrix.heuristics[heuristic][0])
+        self.deltaFunction = getattr(self, Numbrix.heuristics[heuristic][1])
+        self.branching = branching
+        self.branchingFunction = getattr(self, Numbrix.branchings[branching])
+        if propagation:
+            self.propagate(self.initial)
 
     def actions(self, state: NumbrixState):
         """ Retorna uma lista de ações que podem ser executadas a
-        partir do estado passado como argumento. """
-        actions = {}
-        actionsList = []
+        partir do estado passado como argumento. As ações candidatas são
+        calculadas de raiz uma única vez e depois atualizadas a cada
+        colocação, passando do estado pai para os filhos. Só ficam as
+        ações dentro do domínio do número, escolhidas e ordenadas pela
+        ramificação do construtor. """
+        self.prepare(state)
+
+        # Um estado sem solução não tem ações.
+        if self.is_dead(state):
+            return []
+        return self.branchingFunction(state)
+
+    def branch_all(self, state: NumbrixState) -> list:
+        """ Todas as ações candidatas, com os números de menor domínio
+        primeiro. """
+        boardSize = state.get_board().get_size()
+        domains = state.domains.domains
+        actionsList = [action for action in state.candidates.actions(boardSize)
+                       if domains[action[2]] >> (action[0] * boardSize + action[1]) & 1]
+        return sorted(actionsList, key = lambda action : popcount(domains[action[2]]))
+
+    def branch_number(self, state: NumbrixState) -> list:
+        """ Ramificação canónica: só as ações do número candidato com menos
+        posições possíveis. Como as colocações comutam, ramificar em todos
+        os números chega ao mesmo tabuleiro por várias ordens; fixando uma
+        única variável por estado, os ramos diferem no valor dessa variável
+        e cada tabuleiro tem um único caminho, pelo que as procuras em
+        árvore não repetem estados. """
+        return self.branch_on(state, state.candidates.byNumber)
+
+    def branch_cell(self, state: NumbrixState) -> list:
+        """ Ramificação canónica por posição: só as ações da posição vazia
+        que está no domínio de menos números, com os números de menor
+        domínio primeiro. Ao contrário das ações candidatas, os domínios
+        incluem todos os números possíveis da posição, mesmo os que ainda
+        não estão junto a um número colocado. """
         board = state.get_board()
         boardSize = board.get_size()
-        boardNumbers = board.get_all_numbers()
-        
-        def add_action(action, adjacentNumber):
-            actions.setdefault(n, [])
-            verticalNumbers = board.adjacent_vertical_numbers(action[0], action[1])
-            horizontalNumbers = board.adjacent_horizontal_numbers(action[0], action[1])
-            if action not in actions[n] and ((adjacentNumber not in boardNumbers and \
-                (0 in verticalNumbers or 0 in horizontalNumbers)) or adjacentNumber in \
-                    verticalNumbers or adjacentNumber in horizontalNumbers):
-                actions[n].append(action)
-                actionsList.append(action)
-
-        for i in range(boardSize):
-            for j in range(boardSize):
-                number = board.get_number(i, j)
-                if number == 0:
-                    continue
+        domains = state.domains.domains.tolist()
+        byCell = {}
+        for n in range(1, boardSize ** 2 + 1):
+            if not board.has_number(n):
+                for index in bits(domains[n]):
+                    byCell.setdefault(index, []).append(n)
+        if not byCell:
+            return []
+        index, numbers = min(byCell.items(), key = lambda item : len(item[1]))
+        numbers.sort(key = lambda n : popcount(domains[n]))
+        return [(index // boardSize, index % boardSize, n) for n in numbers]
 
-                possibleNumbers = []
-                if number + 1 <= (boardSize ** 2) and number + 1 not in boardNumbers:
-                    possibleNumbers.append(number + 1)
-                if number - 1 > 0 and number - 1 not in boardNumbers:
-                    possibleNumbers.append(number - 1)
-
-                verticalNumbers = board.adjacent_vertical_numbers(i, j)
-                horizontalNumbers = board.adjacent_horizontal_numbers(i, j)
-                for n in possibleNumbers:
-                    adjacentNumber = n + 1 if number == n - 1 else n - 1
-                    if verticalNumbers[0] == 0:
-                        action = (i + 1, j, n)
-                        add_action(action, adjacentNumber)
-                    if verticalNumbers[1] == 0:
-                        action = (i - 1, j, n)
-                        add_action(action, adjacentNumber)
-                    if horizontalNumbers[0] == 0:
-                        action = (i, j - 1, n)
-                        add_action(action, adjacentNumber)
-                    if horizontalNumbers[1] == 0:
-                        action = (i, j + 1, n)
-                        add_action(action, adjacentNumber)
-        
-        actionsList = sorted(actionsList, key = lambda action : len(actions[action[2]]))
-
-        return actionsList
+    def branch_on(self, state: NumbrixState, numbers) -> list:
+        """ Ações do primeiro dos números dados com menos posições possíveis
+        (dentro do domínio), ou nenhuma se algum deles não tiver posições. """
+        boardSize = state.get_board().get_size()
+        domains = state.domains.domains
+        byNumber = state.candidates.byNumber
+        best = None
+        for n in numbers:
+            cells = [index for index in byNumber.get(n, ()) if domains[n] >> index & 1]
+            if best is None or len(cells) < len(best[1]):
+                best = (n, cells)
+                if not cells:
+                    break
+        if best is None:
+            return []
+        return [(index // boardSize, index % boardSize, best[0]) for index in best[1]]
+
+    def branch_chain(self, state: NumbrixState) -> list:
+        """ Ramificação canónica que estende a maior sequência de números
+        consecutivos colocados, pelo número por colocar numa das suas
+        pontas. """
+        board = state.get_board()
+        total = board.get_size() ** 2
+        best = None
+        start = previous = -1
+        for number in list(bits(board.placed)) + [total + 2]:
+            if number != previous + 1:
+                if previous > 0 and (best is None or previous - start > best[1] - best[0]):
+                    best = (start, previous)
+                start = number
+            previous = number
+        if best is None:
+            return []
+        ends = [n for n in (best[0] - 1, best[1] + 1) if 1 <= n <= total]
+        return self.branch_on(state, ends)
+
+    def branch_gap(self, state: NumbrixState) -> list:
+        """ Ramificação canónica pelas pontas da lacuna mais curta da
+        sequência (números a < b colocados, com os números entre eles por
+        colocar, incluindo antes do primeiro e depois do último): a lacuna
+        com menos números é a mais restringida. """
+        board = state.get_board()
+        total = board.get_size() ** 2
+        best = None
+        previous = 0
+        for number in list(bits(board.placed)) + [total + 1]:
+            if number - previous > 1 and (previous or number <= total) and \
+                (best is None or number - previous < best[1] - best[0]):
+                best = (previous, number)
+            previous = number
+        if best is None:
+            return []
+        ends = [n for n in (best[0] + 1, best[1] - 1) if board.has_number(n - 1) or board.has_number(n + 1)]
+        return self.branch_on(state, ends)
+
+    def is_dead(self, state: NumbrixState) -> bool:
+        """ Verifica se o estado, já preparado, não tem solução: alguma
+        lacuna ou número sem posição possível, regiões vazias que não
+        podem ser preenchidas, ou algum domínio vazio. """
+        return state.candidates.dead or state.regions.dead or state.domains.dead
+
+    def prepare(self, state: NumbrixState):
+        """ Calcula de raiz as estruturas do estado que ainda não existem. """
+        board = state.get_board()
+        if state.candidates is None:
+            state.candidates = CandidateActions.from_board(board)
+        if state.regions is None:
+            state.regions = Regions.from_board(board)
+        if state.domains is None:
+            state.domains = Domains.from_board(board)
+        if state.distances is None:
+            state.distances = Distances()
 
     def result(self, state: NumbrixState, action):
         """ Retorna o estado resultante de executar a 'action' sobre
         'state' passado como argumento. A ação a executar deve ser uma
         das presentes na lista obtida pela execução de 
         self.actions(state). """
-        resultState = copy.deepcopy(state)
-        
-        boardActions = self.actions(resultState)
-        if action not in boardActions:
+        if action not in self.actions(state):
             sys.exit("Action not valid, not contained in possible actions.")
+        return self._successor(state, action)
+
+    def apply_unchecked(self, state: NumbrixState, action):
+        """ Igual a result, mas sem voltar a calcular self.actions(state)
+        para validar a ação, que as procuras obtêm diretamente de
+        self.actions(state). Em modo debug a ação é validada na mesma. """
+        if self.debug:
+            return self.result(state, action)
+        return self._successor(state, action)
 
-        resultState.get_board().set_number(action[0], action[1], action[2])
+    def _successor(self, state: NumbrixState, action):
+        """ Devolve uma cópia de 'state' com a 'action' aplicada e, se for
+        o caso, as colocações forçadas propagadas. Não valida a ação. """
+        resultState = state.copy()
+        resultState.place(action[0], action[1], action[2])
+        if self.propagation:
+            self.propagate(resultState)
         return resultState
 
+    def apply(self, state: NumbrixState, action):
+        """ Executa a 'action' sobre o próprio 'state', sem o copiar, e
+        devolve o registo necessário para a desfazer com self.undo. """
+        record = ([action], state.candidates, state.regions, state.domains, state.distances)
+        state.place(action[0], action[1], action[2])
+        if self.propagation:
+            record[0].extend(self.propagate(state))
+        return record
+
+    def undo(self, state: NumbrixState, record):
+        """ Desfaz sobre o próprio 'state' uma ação aplicada com self.apply. """
+        board = state.get_board()
+        actions, state.candidates, state.regions, state.domains, state.distances = record
+        for action in reversed(actions):
+            board.clear_number(action[0], action[1])
+
+    def forced_action(self, state: NumbrixState):
+        """ Devolve uma ação forçada do estado, ou None se não houver. Um
+        número que tem de ficar junto a outro já colocado e só tem uma
+        posição possível é forçado. Se 1 e total já estão colocados, uma
+        posição vazia com no máximo uma adjacente vazia tem de conter um
+        número com um antecessor ou sucessor adjacente já colocado, pelo
+        que também é forçada se só tiver um número candidato. """
+        board = state.get_board()
+        boardSize = board.get_size()
+        candidates = state.candidates
+
+        for n, cells in candidates.byNumber.items():
+            if len(cells) == 1:
+                return (cells[0] // boardSize, cells[0] % boardSize, n)
+
+        if board.has_number(1) and board.has_number(boardSize ** 2):
+            for index, numbers in candidates.byCell.items():
+                if len(numbers) == 1 and board.empty_neighbours(index) <= 1:
+                    return (index // boardSize, index % boardSize, numbers[0])
+
+        return state.domains.forced_action(board)
+
+    def propagate(self, state: NumbrixState) -> list:
+        """ Aplica ao próprio 'state' as ações forçadas até não haver mais,
+        ou até o estado ficar sem solução, e devolve a lista das ações
+        aplicadas. """
+        self.prepare(state)
+
+        applied = []
+        while not self.is_dead(state):
+            action = self.forced_action(state)
+            if action is None:
+                break
+            state.place(action[0], action[1], action[2])
+            applied.append(action)
+
+        return applied
+
     def goal_test(self, state: NumbrixState):
         """ Retorna True se e só se o estado passado como argumento é
         um estado objetivo. Deve verificar se todas as posições do tabuleiro 
-        estão preenchidas com uma sequência de números adjacentes. """
+        estão preenchidas com uma sequência de números adjacentes.
+        Compara apenas os contadores do tabuleiro; em modo debug confirma o
+        resultado percorrendo a sequência. """
         board = state.get_board()
-        boardSize = board.get_size()
+        solved = board.is_solved()
+        if self.debug:
+            check = self.goal_test_vectorized(state) if self.vectorized else \
+                board.placed == (1 << (board.size ** 2 + 1)) - 2 and board.is_chain()
+            assert solved == check, "Link counters out of sync with the board."
+        return solved
 
-        boardNumbers = board.get_all_numbers()
-        if len(set(boardNumbers)) < (boardSize ** 2):
+    def goal_test_vectorized(self, state: NumbrixState):
+        """ Versão NumPy de goal_test: com as posições de 1 a total em
+        vetores de linhas e colunas, todas as diferenças entre números
+        consecutivos têm de ter distância de Manhattan 1. """
+        board = state.get_board()
+        total = board.get_size() ** 2
+        positions = board.positions_array()[1:total + 1]
+        if (positions < 0).any():
             return False
-        
-        for i in range(boardSize):
-            for j in range(boardSize):
-                number = board.get_number(i, j)
-                verticalNumbers = board.adjacent_vertical_numbers(i, j)
-                horizontalNumbers = board.adjacent_horizontal_numbers(i, j)
-                if number + 1 <= (boardSize ** 2) and number + 1 not in \
-                    verticalNumbers and number + 1 not in horizontalNumbers:
-                    return False
-                if number - 1 > 0 and number - 1 not in verticalNumbers \
-                    and number - 1 not in horizontalNumbers:
-                    return False
-        
-        return True
+        rows, cols = np.divmod(positions, board.get_size())
+        return bool((np.abs(np.diff(rows)) + np.abs(np.diff(cols)) == 1).all())
 
     def h(self, node: Node):
-        """ Função heuristica utilizada para a procura A*. """
+        """ Função heuristica utilizada para a procura A*: a escolhida no
+        construtor de entre as de Numbrix.heuristics. """
+        return self.heuristicFunction(node)
+
+    def h_empty_lines(self, node: Node):
+        """ Número de linhas e de colunas com posições ainda por preencher. """
         # (boardSize ** 2) - len(boardNumbers) - optimism (manhattanDistance?)
-        board = node.state.get_board()
-        boardSize = board.get_size()
+        if self.vectorized:
+            return self.h_vectorized(node)
+        rows = node.state.get_board().cells.chunks
+
+        return sum(0 in row for row in rows) + sum(0 in col for col in zip(*rows))
 
-        toComplete = {}
-        for i in range(boardSize):
-            row = "row" + str(i)
-            for j in range(boardSize):
-                col = "col" + str(j)
-                if board.get_number(i, j) == 0:
-                    toComplete[row] = True
-                    toComplete[col] = True
-                    
-        return len(toComplete)
-
-        '''
-        #Alternative
+    def h_vectorized(self, node: Node):
+        """ Versão NumPy de h_empty_lines, com reduções sobre a matriz do
+        tabuleiro. """
+        empty = node.state.get_board().cells_array() == 0
+        return int(empty.any(axis=1).sum() + empty.any(axis=0).sum())
+
+    def h_delta(self, node: Node, action):
+        """ Estimativa da variação de h ao aplicar 'action' a node, sem
+        construir o estado filho, dada pela estimativa registada com a
+        heurística em Numbrix.heuristics. As colocações forçadas pela
+        propagação não entram na estimativa. """
+        return self.deltaFunction(node, action)
+
+    def h_completed_chain(self, node: Node):
+        """ Número de números que ainda não têm o antecessor e o sucessor
+        colocados (os extremos só precisam de um deles). """
         board = node.state.get_board()
-        boardSize = board.get_size()
-        boardNumbers = board.get_all_numbers()
-
-        completedNumbers = 0
-        for number in boardNumbers:
-            if number == 1 and number + 1 in boardNumbers:
-                completedNumbers += 1
-            elif number == (boardSize ** 2) and number - 1 in boardNumbers:
-                completedNumbers += 1
-            elif number - 1 in boardNumbers and number + 1 in boardNumbers:
-                completedNumbers += 1
-        
-        return completedNumbers
-        '''
-
-        '''
-        #Alternative
+        return Numbrix.incomplete(board.placed, board.get_size() ** 2)
+
+    @staticmethod
+    def incomplete(placed: int, total: int) -> int:
+        """ h_completed_chain para o bitset 'placed' dos números colocados. """
+        completed = placed & (placed >> 1 | 1 << total) & (placed << 1 | 2)
+        return total - popcount(completed)
+
+    def h_actions(self, node: Node):
+        """ Número de ações possíveis no estado. """
         return len(self.actions(node.state))
-        '''
+
+    def h_gap_length(self, node: Node):
+        """ Soma dos comprimentos das lacunas da sequência, isto é, o número
+        de números por colocar. """
+        board = node.state.get_board()
+        return board.get_size() ** 2 - popcount(board.placed)
+
+    def h_gap_slack(self, node: Node):
+        """ Soma, pelas lacunas entre números colocados a < b, da folga
+        b - a - d, em que d é o caminho mais curto entre a e b por posições
+        vazias: o desvio que cada lacuna ainda tem de fazer. """
+        state = node.state
+        board = state.get_board()
+        self.prepare(state)
+        slack = 0
+        previous = 0
+        for number in bits(board.placed):
+            if previous and number - previous > 1:
+                distance = state.distances.between(board, previous, number)
+                slack += number - previous - (distance if distance is not None else 0)
+            previous = number
+        return slack
+
+    def h_unreachable(self, node: Node):
+        """ Número de números por colocar que ainda não podem ser colocados
+        por não terem o antecessor nem o sucessor colocados. """
+        board = node.state.get_board()
+        return Numbrix.unreachable(board.placed, board.get_size() ** 2)
+
+    @staticmethod
+    def unreachable(placed: int, total: int) -> int:
+        """ h_unreachable para o bitset 'placed' dos números colocados. """
+        reachable = (placed << 1 | placed >> 1) & ~placed & ((1 << (total + 1)) - 2)
+        return total - popcount(placed) - popcount(reachable)
+
+    def h_domain_size(self, node: Node):
+        """ Soma, pelos números por colocar, do número de posições do seu
+        domínio além da primeira. """
+        state = node.state
+        board = state.get_board()
+        self.prepare(state)
+        domains = state.domains.domains.tolist()
+        return sum(popcount(domains[number]) - 1 for number in range(1, board.get_size() ** 2 + 1)
+                   if not board.has_number(number))
+
+    def delta_empty_lines(self, node: Node, action):
+        """ A linha e a coluna da posição deixam de contar se esta for a sua
+        única posição vazia. """
+        rows = node.state.get_board().cells.chunks
+        row, col = action[0], action[1]
+        return -(rows[row].count(0) == 1) - (sum(chunk[col] == 0 for chunk in rows) == 1)
+
+    def delta_completed_chain(self, node: Node, action):
+        """ Diferença de h_completed_chain com o número da ação colocado. """
+        board = node.state.get_board()
+        total = board.get_size() ** 2
+        return Numbrix.incomplete(board.placed | 1 << action[2], total) - \
+            Numbrix.incomplete(board.placed, total)
+
+    def delta_gap_length(self, node: Node, action):
+        """ Há menos um número por colocar. """
+        return -1
+
+    def delta_unreachable(self, node: Node, action):
+        """ Diferença de h_unreachable com o número da ação colocado. """
+        board = node.state.get_board()
+        total = board.get_size() ** 2
+        return Numbrix.unreachable(board.placed | 1 << action[2], total) - \
+            Numbrix.unreachable(board.placed, total)
+
+    def delta_unknown(self, node: Node, action):
+        """ Para as heurísticas que dependem das estruturas do estado filho
+        (ações, distâncias ou domínios), não há estimativa barata: 0. """
+        return 0
+
+    # Heurísticas disponíveis, por nome, com os nomes do respetivo método e
+    # do método que estima a sua variação sem construir o estado filho.
+    heuristics = {
+        "empty_lines": ("h_empty_lines", "delta_empty_lines"),
+        "completed_chain": ("h_completed_chain", "delta_completed_chain"),
+        "actions": ("h_actions", "delta_unknown"),
+        "gap_length": ("h_gap_length", "delta_gap_length"),
+        "gap_slack": ("h_gap_slack", "delta_unknown"),
+        "unreachable": ("h_unreachable", "delta_unreachable"),
+        "domain_size": ("h_domain_size", "delta_unknown"),
+    }
+
+    # Ramificações disponíveis, por nome, com o nome do respetivo método.
+    branchings = {
+        "all": "branch_all",
+        "number": "branch_number",
+        "cell": "branch_cell",
+        "chain": "branch_chain",
+        "gap": "branch_gap",
+    }
 
 
 if __name__ == "__main__":
@@ -290,7 +1435,7 @@ if __name__ == "__main__":
     if len(sys.argv) != 2:
         sys.exit("Incorrect Program Usage.\nCorrect Usage: $ python3 numbrix.py <instance_file>")
     board = Board.parse_instance(sys.argv[1])
-    problem = Numbrix(board)
+    problem = Numbrix(board, branching = "cell")
 
     '''
     # Example
@@ -308,8 +1453,8 @@ if __name__ == "__main__":
     print("Solution:\n", s5.get_board().to_string(), sep="")
     '''
 
-    # Usar uma técnastara resolver a instância,
-    solutionNode = astar_search(problem)
+    # Usar uma técnica de procura para resolver a instância,
+    solutionNode = depth_first_inplace_search(problem)
 
     # Retirar a solução a partir do nó resultante,
     solutionState = solutionNode.state
@@ -6,8 +6,10 @@ then create problem instances and solve them with calls to the various search
 functions.
 """
 
+import functools
+import heapq
 import sys
-from collections import deque
+from collections import deque, OrderedDict
 
 from utils import *
 
@@ -38,6 +40,23 @@ class Problem:
         self.actions(state)."""
         raise NotImplementedError
 
+    def apply_unchecked(self, state, action):
+        """Return the state that results from executing an action that was
+        just produced by self.actions(state). The search functions call this
+        instead of result for such actions, so subclasses may override it to
+        skip re-validating the action. The default method calls result."""
+        return self.result(state, action)
+
+    def apply(self, state, action):
+        """Execute the given action on state itself, mutating it instead of
+        building a new state, and return a record that self.undo can use to
+        revert it. Only needed by depth_first_inplace_search."""
+        raise NotImplementedError
+
+    def undo(self, state, record):
+        """Revert, on state itself, an action executed by self.apply."""
+        raise NotImplementedError
+
     def goal_test(self, state):
         """Return True if the state is a goal. The default method compares the
         state to self.goal or checks for state in self.goal if it is a
@@ -56,6 +75,12 @@ class Problem:
         and action. The default method costs 1 for every step in the path."""
         return c + 1
 
+    def h_delta(self, node, action):
+        """Return a cheap estimate of how much h changes from node to the
+        child reached by action, without building the child's state. Used by
+        the lazy best-first searches; the default method estimates 0."""
+        return 0
+
     def value(self, state):
         """For optimization problems, each state has a value. Hill Climbing
         and related algorithms try to maximize this value."""
@@ -71,9 +96,12 @@ class Node:
     that if a state is arrived at by two paths, then there are two nodes with
     the same state. Also includes the action that got us to this state, and
     the total path_cost (also known as g) to reach the node. Other functions
-    may add an f and h value; see best_first_graph_search and astar_search for
-    an explanation of how the f and h values are handled. You will not need to
-    subclass this class."""
+    may set the f and h values, which are None until then; see
+    best_first_graph_search and astar_search for an explanation of how the f
+    and h values are handled. Nodes use __slots__, as searches can keep
+    millions of them. You will not need to subclass this class."""
+
+    __slots__ = ('state', 'parent', 'action', 'path_cost', 'depth', 'f', 'h')
 
     def __init__(self, state, parent=None, action=None, path_cost=0):
         """Create a search tree Node, derived from a parent by an action."""
@@ -81,9 +109,9 @@ class Node:
         self.parent = parent
         self.action = action
         self.path_cost = path_cost
-        self.depth = 0
-        if parent:
-            self.depth = parent.depth + 1
+        self.depth = parent.depth + 1 if parent else 0
+        self.f = None
+        self.h = None
 
     def __repr__(self):
         return "<Node {}>".format(self.state)
@@ -92,13 +120,17 @@ class Node:
         return self.state < node.state
 
     def expand(self, problem):
-        """List the nodes reachable in one step from this node."""
-        return [self.child_node(problem, action)
+        """List the nodes reachable in one step from this node. The actions
+        come straight from problem.actions, so they are applied unchecked."""
+        return [self.child_node(problem, action, unchecked=True)
                 for action in problem.actions(self.state)]
 
-    def child_node(self, problem, action):
+    def child_node(self, problem, action, unchecked=False):
         """[Figure 3.10]"""
-        next_state = problem.result(self.state, action)
+        if unchecked:
+            next_state = problem.apply_unchecked(self.state, action)
+        else:
+            next_state = problem.result(self.state, action)
         next_node = Node(next_state, self, action, problem.path_cost(self.path_cost, self.state, action, next_state))
         return next_node
 
@@ -130,6 +162,18 @@ class Node:
         return hash(self.state)
 
 
+def node_cache(fn, slot):
+    """Wrap fn(node) to cache its value in the given Node slot ('f' or 'h'),
+    as memoize(fn, slot) does with an attribute, but using the slot directly."""
+    def cached_fn(node):
+        value = getattr(node, slot)
+        if value is None:
+            value = fn(node)
+            setattr(node, slot, value)
+        return value
+    return cached_fn
+
+
 # ______________________________________________________________________________
 
 
@@ -171,6 +215,138 @@ class SimpleProblemSolvingAgentProgram:
         raise NotImplementedError
 
 
+# ______________________________________________________________________________
+
+
+class TranspositionTable:
+    """A bounded table of facts about states, keyed by hash(state), for tree
+    searches that can reach the same state along different paths. It records
+    states proven dead (no goal below them) and caches heuristic values.
+    When full, policy 'lru' evicts the least recently used entry, and policy
+    'depth' uses capacity slots indexed by the hash, where a new entry only
+    replaces a deeper one (shallower states root bigger subtrees). Keys are
+    hashes, not states, so distinct states with equal hashes are conflated;
+    use a problem whose states hash well (e.g. Zobrist hashing).
+    It is used by depth_first_tree_search (eager and lazy),
+    depth_first_inplace_search and recursive_best_first_search."""
+
+    def __init__(self, capacity=100000, policy='lru'):
+        if policy not in ('lru', 'depth'):
+            raise ValueError("Policy must be either 'lru' or 'depth'.")
+        self.capacity = capacity
+        self.policy = policy
+        self.hits = 0
+        if policy == 'lru':
+            self.entries = OrderedDict()
+        else:
+            self.slots = [None] * capacity
+
+    def lookup(self, key):
+        """Return the [dead, h, depth] entry for key, or None."""
+        if self.policy == 'lru':
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+        slot = self.slots[key % self.capacity]
+        return slot[1] if slot is not None and slot[0] == key else None
+
+    def store(self, key, depth):
+        """Return the entry for key, creating it (and maybe evicting another
+        one) if needed. With policy 'depth' it returns None when the slot is
+        kept by a shallower entry."""
+        entry = self.lookup(key)
+        if entry is not None:
+            entry[2] = min(entry[2], depth)
+            return entry
+        entry = [False, None, depth]
+        if self.policy == 'lru':
+            self.entries[key] = entry
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+            return entry
+        index = key % self.capacity
+        slot = self.slots[index]
+        if slot is not None and slot[1][2] < depth:
+            return None
+        self.slots[index] = (key, entry)
+        return entry
+
+    def is_dead(self, state):
+        """Return True if state was recorded as having no goal below it."""
+        entry = self.lookup(hash(state))
+        if entry is not None and entry[0]:
+            self.hits += 1
+            return True
+        return False
+
+    def mark_dead(self, state, depth=0):
+        """Record that the subtree below state, at the given depth, has been
+        fully searched without finding a goal."""
+        entry = self.store(hash(state), depth)
+        if entry is not None:
+            entry[0] = True
+
+    def heuristic(self, h, node):
+        """Return h(node), cached by the hash of node.state."""
+        key = hash(node.state)
+        entry = self.lookup(key)
+        if entry is not None and entry[1] is not None:
+            self.hits += 1
+            return entry[1]
+        value = h(node)
+        entry = self.store(key, node.depth)
+        if entry is not None:
+            entry[1] = value
+        return value
+
+    def __len__(self):
+        if self.policy == 'lru':
+            return len(self.entries)
+        return sum(slot is not None for slot in self.slots)
+
+
+class StackFrontier:
+    """A LIFO frontier of nodes that also keeps the set of their states, so
+    that 'child in frontier' is a hash lookup instead of a scan comparing
+    nodes. The set is kept in sync on every append and pop; as in the graph
+    searches, a state is expected to be in the frontier at most once."""
+
+    def __init__(self, nodes=()):
+        self.nodes = deque()
+        self.states = set()
+        self.extend(nodes)
+
+    def append(self, node):
+        self.nodes.append(node)
+        self.states.add(node.state)
+
+    def extend(self, nodes):
+        for node in nodes:
+            self.append(node)
+
+    def pop(self):
+        node = self.nodes.pop()
+        self.states.discard(node.state)
+        return node
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node.state in self.states
+
+
+class QueueFrontier(StackFrontier):
+    """A FIFO frontier of nodes with the set of their states, as
+    StackFrontier."""
+
+    def pop(self):
+        node = self.nodes.popleft()
+        self.states.discard(node.state)
+        return node
+
+
 # ______________________________________________________________________________
 # Uninformed Search algorithms
 
@@ -194,14 +370,25 @@ def breadth_first_tree_search(problem):
     return None
 
 
-def depth_first_tree_search(problem):
+def depth_first_tree_search(problem, table=None, lazy=False):
     """
     [Figure 3.7]
     Search the deepest nodes in the search tree first.
     Search through the successors of a problem to find a goal.
     The argument frontier should be an empty queue.
     Repeats infinitely in case of loops.
+    With a TranspositionTable, every state whose subtree is exhausted is
+    recorded as dead and later duplicates of it are skipped.
+    With lazy, the frontier holds (parent, remaining actions) pairs instead
+    of every generated child, and each child state is only built when it is
+    about to be visited; the visiting order is the same, but the states kept
+    alive are the ones on the current path only.
     """
+    if lazy:
+        return depth_first_lazy_search(problem, table)
+
+    if table is not None:
+        return depth_first_table_search(problem, table)
 
     frontier = [Node(problem.initial)]  # Stack
 
@@ -213,6 +400,50 @@ def depth_first_tree_search(problem):
     return None
 
 
+def depth_first_table_search(problem, table):
+    """depth_first_tree_search with a TranspositionTable: see there. Each
+    expanded node is pushed back below its children, so popping it again
+    means its whole subtree has been searched."""
+    frontier = [(Node(problem.initial), False)]  # Stack of (node, searched)
+
+    while frontier:
+        node, searched = frontier.pop()
+        if searched:
+            table.mark_dead(node.state, node.depth)
+            continue
+        if problem.goal_test(node.state):
+            return node
+        if table.is_dead(node.state):
+            continue
+        frontier.append((node, True))
+        frontier.extend((child, False) for child in node.expand(problem))
+    return None
+
+
+def depth_first_lazy_search(problem, table=None):
+    """depth_first_tree_search with lazy successor generation: see there."""
+    node = Node(problem.initial)
+    if problem.goal_test(node.state):
+        return node
+
+    frontier = [(node, reversed(problem.actions(node.state)))]  # Stack of (parent, actions)
+    while frontier:
+        parent, actions = frontier[-1]
+        action = next(actions, None)
+        if action is None:
+            frontier.pop()
+            if table is not None:
+                table.mark_dead(parent.state, parent.depth)
+            continue
+        node = parent.child_node(problem, action, unchecked=True)
+        if problem.goal_test(node.state):
+            return node
+        if table is not None and table.is_dead(node.state):
+            continue
+        frontier.append((node, reversed(problem.actions(node.state))))
+    return None
+
+
 def depth_first_graph_search(problem):
     """
     [Figure 3.7]
@@ -222,7 +453,7 @@ def depth_first_graph_search(problem):
     Does not get trapped by loops.
     If two paths reach a state, only use the first one.
     """
-    frontier = [(Node(problem.initial))]  # Stack
+    frontier = StackFrontier([Node(problem.initial)])  # Stack
 
     explored = set()
     while frontier:
@@ -230,11 +461,59 @@ def depth_first_graph_search(problem):
         if problem.goal_test(node.state):
             return node
         explored.add(node.state)
-        frontier.extend(child for child in node.expand(problem)
-                        if child.state not in explored and child not in frontier)
+        for child in node.expand(problem):
+            if child.state not in explored and child not in frontier:
+                frontier.append(child)
     return None
 
 
+def depth_first_inplace_search(problem, table=None):
+    """
+    Depth-first tree search over a single mutable state. Children are
+    visited in the same order as depth_first_tree_search, but each one is
+    reached with problem.apply and left with problem.undo, so no state is
+    copied in the loop and memory grows with the depth only.
+    problem.initial is the state that gets mutated; it is restored before
+    returning or raising, and the nodes on the path to the goal are rebuilt from it.
+    With a TranspositionTable, every state whose subtree is exhausted is
+    recorded as dead and later duplicates of it are skipped.
+    """
+    state = problem.initial
+    if problem.goal_test(state):
+        return Node(problem.initial)
+
+    undo_stack = []
+    goal = None
+    try:
+        frontier = [reversed(problem.actions(state))]  # Stack of action iterators
+        while frontier:
+            action = next(frontier[-1], None)
+            if action is None:
+                frontier.pop()
+                if table is not None:
+                    table.mark_dead(state, len(undo_stack))
+                if undo_stack:
+                    problem.undo(state, undo_stack.pop()[1])
+                continue
+            undo_stack.append((action, problem.apply(state, action)))
+            if problem.goal_test(state):
+                goal = [action for action, _ in undo_stack]
+                break
+            if table is not None and table.is_dead(state):
+                problem.undo(state, undo_stack.pop()[1])
+                continue
+            frontier.append(reversed(problem.actions(state)))
+    finally:
+        while undo_stack:
+            problem.undo(state, undo_stack.pop()[1])
+    if goal is None:
+        return None
+    node = Node(problem.initial)
+    for action in goal:
+        node = node.child_node(problem, action, unchecked=True)
+    return node
+
+
 def breadth_first_graph_search(problem):
     """[Figure 3.11]
     Note that this function can be implemented in a
@@ -244,10 +523,10 @@ def breadth_first_graph_search(problem):
     node = Node(problem.initial)
     if problem.goal_test(node.state):
         return node
-    frontier = deque([node])
+    frontier = QueueFrontier([node])  # FIFO queue
     explored = set()
     while frontier:
-        node = frontier.popleft()
+        node = frontier.pop()
         explored.add(node.state)
         for child in node.expand(problem):
             if child.state not in explored and child not in frontier:
@@ -257,15 +536,19 @@ def breadth_first_graph_search(problem):
     return None
 
 
-def best_first_graph_search(problem, f, display=False):
+def best_first_graph_search(problem, f, display=False, score=None):
     """Search the nodes with the lowest f scores first.
     You specify the function f(node) that you want to minimize; for example,
     if f is a heuristic estimate to the goal, then we have greedy best
     first search; if f is node.depth then we have breadth-first search.
-    There is a subtlety: the line "f = memoize(f, 'f')" means that the f
+    There is a subtlety: the line "f = node_cache(f, 'f')" means that the f
     values will be cached on the nodes as they are computed. So after doing
-    a best first search you can examine the f values of the path returned."""
-    f = memoize(f, 'f')
+    a best first search you can examine the f values of the path returned.
+    If score(node, action) is given, a cheap estimate of f for the child of
+    node by action, the search is delegated to best_first_lazy_search."""
+    if score is not None:
+        return best_first_lazy_search(problem, f, score, display)
+    f = node_cache(f, 'f')
     node = Node(problem.initial)
     frontier = PriorityQueue('min', f)
     frontier.append(node)
@@ -287,6 +570,42 @@ def best_first_graph_search(problem, f, display=False):
     return None
 
 
+def best_first_lazy_search(problem, f, score, display=False):
+    """best_first_graph_search with lazy child materialization: frontier
+    entries are (score, parent, action) and a child's state is only built
+    when its entry is popped. As the frontier holds no states, duplicates
+    are dropped when popped instead of when generated. A child whose f turns
+    out higher than the best score left in the frontier is pushed back with
+    its f, and is expanded right away otherwise, so the order is exact when
+    score never overestimates f, and approximate otherwise."""
+    f = node_cache(f, 'f')
+    node = Node(problem.initial)
+    counter = 0  # Breaks ties between equal scores in insertion order
+    frontier = [(f(node), counter, node, None)]
+    explored = set()
+    while frontier:
+        _, _, node, action = heapq.heappop(frontier)
+        if action is not None:
+            node = node.child_node(problem, action, unchecked=True)
+            if node.state in explored:
+                continue
+            if frontier and f(node) > frontier[0][0]:
+                counter += 1
+                heapq.heappush(frontier, (node.f, counter, node, None))
+                continue
+        elif node.state in explored:
+            continue
+        if problem.goal_test(node.state):
+            if display:
+                print(len(explored), "paths have been expanded and", len(frontier), "paths remain in the frontier")
+            return node
+        explored.add(node.state)
+        for action in problem.actions(node.state):
+            counter += 1
+            heapq.heappush(frontier, (score(node, action), counter, node, action))
+    return None
+
+
 def uniform_cost_search(problem, display=False):
     """[Figure 3.14]"""
     return best_first_graph_search(problem, lambda node: node.path_cost, display)
@@ -410,16 +729,29 @@ greedy_best_first_graph_search = best_first_graph_search
 
 
 # Greedy best-first search is accomplished by specifying f(n) = h(n).
-def greedy_search(problem, h=None):
-    """f(n) = h(n)"""
-    h = memoize(h or problem.h, 'h')
+def greedy_search(problem, h=None, lazy=False):
+    """f(n) = h(n)
+    With lazy, children are scored by h(n) + problem.h_delta(n, action) and
+    only built when popped; see best_first_lazy_search."""
+    h = node_cache(h or problem.h, 'h')
+    if lazy:
+        return best_first_graph_search(problem, h, score=lambda n, action: h(n) + problem.h_delta(n, action))
     return best_first_graph_search(problem, h)
 
-def astar_search(problem, h=None, display=False):
+def astar_search(problem, h=None, display=False, lazy=False):
     """A* search is best-first graph search with f(n) = g(n)+h(n).
     You need to specify the h function when you call astar_search, or
-    else in your Problem subclass."""
-    h = memoize(h or problem.h, 'h')
+    else in your Problem subclass.
+    With lazy, children are scored by g(n) + h(n) + problem.h_delta(n, action)
+    and only built when popped; see best_first_lazy_search. The score leaves
+    out the step cost, which needs the child's state, so with non-negative
+    step costs it is a lower bound and the popped child is pushed back with
+    its real f when that is higher than the next entry's score."""
+    h = node_cache(h or problem.h, 'h')
+    if lazy:
+        def score(n, action):
+            return n.path_cost + h(n) + problem.h_delta(n, action)
+        return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display, score)
     return best_first_graph_search(problem, lambda n: n.path_cost + h(n), display)
 
 
@@ -603,15 +935,25 @@ class PlanRoute(Problem):
 # Other search algorithms
 
 
-def recursive_best_first_search(problem, h=None):
-    """[Figure 3.26]"""
-    h = memoize(h or problem.h, 'h')
+def recursive_best_first_search(problem, h=None, table=None):
+    """[Figure 3.26]
+    With a TranspositionTable, heuristic values are cached by state, states
+    whose subtree ends with an infinite f (no goal below them) are recorded
+    as dead, and later duplicates of them are left out of the successors."""
+    h = h or problem.h
+    if table is not None:
+        h = functools.partial(table.heuristic, h)
+    h = node_cache(h, 'h')
 
     def RBFS(problem, node, flimit):
         if problem.goal_test(node.state):
             return node, 0  # (The second value is immaterial)
         successors = node.expand(problem)
+        if table is not None:
+            successors = [s for s in successors if not table.is_dead(s.state)]
         if len(successors) == 0:
+            if table is not None:
+                table.mark_dead(node.state, node.depth)
             return None, np.inf
         for s in successors:
             s.f = max(s.path_cost + h(s), node.f)
@@ -620,6 +962,8 @@ def recursive_best_first_search(problem, h=None):
             successors.sort(key=lambda x: x.f)
             best = successors[0]
             if best.f > flimit:
+                if table is not None and best.f == np.inf:
+                    table.mark_dead(node.state, node.depth)
                 return None, best.f
             if len(successors) > 1:
                 alternative = successors[1].f
@@ -920,7 +1264,7 @@ def genetic_search(problem, ngen=1000, pmut=0.1, n=20):
     # TODO: Use this function to make Problems work with genetic_algorithm.
 
     s = problem.initial_state
-    states = [problem.result(s, a) for a in problem.actions(s)]
+    states = [problem.apply_unchecked(s, a) for a in problem.actions(s)]
     random.shuffle(states)
     return genetic_algorithm(states[:n], problem.value, ngen, pmut)
 
@@ -1533,6 +1877,20 @@ class InstrumentedProblem(Problem):
         self.states += 1
         return self.problem.result(state, action)
 
+    def apply_unchecked(self, state, action):
+        self.states += 1
+        return self.problem.apply_unchecked(state, action)
+
+    def apply(self, state, action):
+        self.states += 1
+        return self.problem.apply(state, action)
+
+    def undo(self, state, record):
+        return self.problem.undo(state, record)
+
+    def h_delta(self, node, action):
+        return self.problem.h_delta(node, action)
+
     def goal_test(self, state):
         self.goal_tests += 1
         result = self.problem.goal_test(state)
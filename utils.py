@@ -724,10 +724,17 @@ class PriorityQueue:
     order) is returned first.
     If order is 'min', the item with minimum f(x) is
     returned first; if order is 'max', then it is the item with maximum f(x).
-    Also supports dict-like lookup."""
+    Also supports dict-like lookup.
+    The heap holds [f(x), x, removed] entries and a dict maps each item to
+    its live entries, so membership is O(1) and deletion marks the entry
+    as removed in O(1) instead of re-heapifying; removed entries are
+    discarded when they reach the top of the heap, or all at once when they
+    outnumber the live ones."""
 
     def __init__(self, order='min', f=lambda x: x):
         self.heap = []
+        self.entries = {}  # item -> list of live heap entries
+        self.size = 0
         if order == 'min':
             self.f = f
         elif order == 'max':  # now item with max f(x)
@@ -737,7 +744,10 @@ class PriorityQueue:
 
     def append(self, item):
         """Insert item at its correct position."""
-        heapq.heappush(self.heap, (self.f(item), item))
+        entry = [self.f(item), item, False]
+        heapq.heappush(self.heap, entry)
+        self.entries.setdefault(item, []).append(entry)
+        self.size += 1
 
     def extend(self, items):
         """Insert each item in items at its correct position."""
@@ -747,34 +757,49 @@ class PriorityQueue:
     def pop(self):
         """Pop and return the item (with min or max f(x) value)
         depending on the order."""
-        if self.heap:
-            return heapq.heappop(self.heap)[1]
-        else:
-            raise Exception('Trying to pop from empty PriorityQueue.')
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if not entry[2]:
+                self._forget(entry)
+                return entry[1]
+        raise Exception('Trying to pop from empty PriorityQueue.')
+
+    def _forget(self, entry):
+        """Drop a live entry from the item index."""
+        live = self.entries[entry[1]]
+        for i, other in enumerate(live):
+            if other is entry:
+                del live[i]
+                break
+        if not live:
+            del self.entries[entry[1]]
+        self.size -= 1
 
     def __len__(self):
         """Return current capacity of PriorityQueue."""
-        return len(self.heap)
+        return self.size
 
     def __contains__(self, key):
         """Return True if the key is in PriorityQueue."""
-        return any([item == key for _, item in self.heap])
+        return key in self.entries
 
     def __getitem__(self, key):
         """Returns the first value associated with key in PriorityQueue.
         Raises KeyError if key is not present."""
-        for value, item in self.heap:
-            if item == key:
-                return value
-        raise KeyError(str(key) + " is not in the priority queue")
+        if key not in self.entries:
+            raise KeyError(str(key) + " is not in the priority queue")
+        return self.entries[key][0][0]
 
     def __delitem__(self, key):
         """Delete the first occurrence of key."""
-        try:
-            del self.heap[[item == key for _, item in self.heap].index(True)]
-        except ValueError:
+        if key not in self.entries:
             raise KeyError(str(key) + " is not in the priority queue")
-        heapq.heapify(self.heap)
+        entry = self.entries[key][0]
+        entry[2] = True
+        self._forget(entry)
+        if len(self.heap) > 2 * self.size + 32:  # Mostly removed entries
+            self.heap = [entry for entry in self.heap if not entry[2]]
+            heapq.heapify(self.heap)
 
 
 # ______________________________________________________________________________